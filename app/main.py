@@ -1,7 +1,8 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.concurrency import run_in_threadpool
 from app.database import MongoDB
 from app.services.user_service import UserService, Token
 from app.services.candidate_service import CandidateService
@@ -9,19 +10,49 @@ from app.models.user import User
 from app.models.candidate import Candidate
 from app.models.authentication import authentication_request
 from typing import Annotated
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import pandas as pd
 
+import asyncio
+import logging
 import os
 from datetime import timedelta
 from app.utils.json_encoder import CustomJSONEncoder
+from app.utils.compression import CompressionMiddleware, PrecompressedCache, negotiate_encoding
 import json
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Periodically move candidates that were not updated for CANDIDATE_ARCHIVE_AFTER_DAYS
+# days to the archive collection, every CANDIDATE_ARCHIVE_INTERVAL_HOURS hours
+async def archive_stale_candidates_periodically(max_age_days: float, interval_hours: float):
+    while True:
+        try:
+            await run_in_threadpool(candidate_service.archive_stale_candidates, max_age_days)
+        except Exception:
+            logging.exception("Archiving stale candidates failed")
+        await asyncio.sleep(interval_hours * 3600)
+
+# Run the candidate archiver for the lifetime of the app
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    archiver = None
+    archive_after_days = os.getenv("CANDIDATE_ARCHIVE_AFTER_DAYS")
+    if archive_after_days:
+        archiver = asyncio.create_task(archive_stale_candidates_periodically(
+            float(archive_after_days), float(os.getenv("CANDIDATE_ARCHIVE_INTERVAL_HOURS", "24"))))
+    yield
+    if archiver:
+        archiver.cancel()
+        try:
+            await archiver
+        except asyncio.CancelledError:
+            pass
+
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.json_encoder = CustomJSONEncoder
 
 # Enable CORS
@@ -33,6 +64,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large responses (gzip/brotli/zstd) based on Accept-Encoding
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", "500")),
+)
+
+# Compressed variants of the generated reports, reused until the report changes
+report_cache = PrecompressedCache()
+
 # MongoDB Configuration
 mongo_db = MongoDB()
 mongo_db.connect()
@@ -101,57 +141,80 @@ def get_users():
 @app.post("/candidate")
 def create_candidate(candidate: Candidate, current_user: User = Depends(get_current_user)):
     """Create a new candidate."""
-    id,uuid = candidate_service.create_candidate(candidate)
+    id,uuid = candidate_service.create_candidate(current_user["uuid"], candidate)
     return {"message": "Candidate created successfully", "candidate_id": str(id),"uuid":uuid}
 
 # Get candidate by UUID route
 @app.get("/candidate/{candidate_uuid}")
 def get_candidate(candidate_uuid: str, current_user: User = Depends(get_current_user)):
     """Get candidate details by UUID."""
-    return candidate_service.get_candidate_by_uuid(candidate_uuid)
+    return candidate_service.get_candidate_by_uuid(current_user["uuid"], candidate_uuid)
 
 # Update candidate by UUID route
 @app.put("/candidate/{candidate_uuid}")
 def update_candidate(candidate_uuid: str, candidate: Candidate, current_user: User = Depends(get_current_user)):
     """Update candidate details by UUID."""
-    str(candidate_service.update_candidate(candidate_uuid, candidate))
+    str(candidate_service.update_candidate(current_user["uuid"], candidate_uuid, candidate))
     return {"message":"Candidate updated successfully"}
 
 # Delete candidate by UUID route
 @app.delete("/candidate/{candidate_uuid}")
 def delete_candidate(candidate_uuid: str, current_user: User = Depends(get_current_user)):
     """Delete candidate by UUID."""
-    candidate_service.delete_candidate(candidate_uuid)
+    candidate_service.delete_candidate(current_user["uuid"], candidate_uuid)
     return {"message":"Candidate deleted successfully"}
     
 # Get all candidates route
 @app.get("/all_candidates")
-def get_all_candidates(current_user: User = Depends(get_current_user)):
-    """Get a list of all candidates."""
-    return candidate_service.get_all_candidates()
+def get_all_candidates(include_archived: bool = Query(False),
+                       current_user: User = Depends(get_current_user)):
+    """Get a list of all candidates owned by the current user."""
+    return candidate_service.get_all_candidates(current_user["uuid"], include_archived)
 
 # Search candidates for a specific user by a dynamic attribute
 @app.get("/all_candidates/search", response_model=list)
 def search_candidates(attribute: str = Query(...), value: str = Query(...),
+                      include_archived: bool = Query(False),
                       current_user: User = Depends(user_service.get_current_user)):
     """Search candidates based on a dynamic attribute."""
-    candidates = candidate_service.search_candidates(attribute, value)
+    candidates = candidate_service.search_candidates(current_user["uuid"], attribute, value, include_archived)
 
     # Manually convert ObjectId to string for serialization
     serialized_candidates = json.loads(json.dumps(candidates, cls=CustomJSONEncoder))
 
     return serialized_candidates
 
-@app.get("/generate-report")
-async def generate_csv_report(current_user: User = Depends(user_service.get_current_user)):
-    csv_content = candidate_service.generate_csv_content()
+# Search cache metrics route
+@app.get("/all_candidates/search/cache-stats")
+def search_cache_stats(current_user: User = Depends(get_current_user)):
+    """Get the hit rate and size of the search result cache."""
+    return candidate_service.search_cache.stats()
 
-    # Save the generated CSV file locally (optional)
-    with open("candidates_report.csv", "wb") as f:
+@app.get("/generate-report")
+async def generate_csv_report(request: Request, include_archived: bool = Query(False),
+                              current_user: User = Depends(user_service.get_current_user)):
+    # Build the report off the event loop
+    csv_content = await run_in_threadpool(
+        candidate_service.generate_csv_content, current_user["uuid"], include_archived)
+    report_key = f"{current_user['uuid']}_archived" if include_archived else current_user["uuid"]
+
+    # Serve a pre-compressed variant when the client accepts one
+    encoding = negotiate_encoding(request.headers.get("Accept-Encoding", ""))
+    if encoding:
+        body = await report_cache.get(report_key, csv_content, encoding)
+        return Response(body, media_type="text/csv", headers={
+            "Content-Encoding": encoding,
+            "Content-Disposition": 'attachment; filename="candidates_report.csv"',
+            "Vary": "Accept-Encoding",
+        })
+
+    # Save the generated CSV file locally (optional), one file per owner
+    report_path = f"candidates_report_{report_key}.csv"
+    with open(report_path, "wb") as f:
         f.write(csv_content)
 
     # Return the CSV file as a response
-    return FileResponse("candidates_report.csv", filename="candidates_report.csv", media_type="text/csv")
+    return FileResponse(report_path, filename="candidates_report.csv", media_type="text/csv")
 
 
 # Run the FastAPI app using uvicorn
@@ -1,41 +1,186 @@
 from app.models.candidate import Candidate
 from app.database import MongoDB
+from bson import ObjectId
 from bson.json_util import dumps
+from datetime import datetime
+from pymongo import ASCENDING, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 import json
+import logging
+
+# Every candidate document carries the key of the user that owns it. All
+# queries lead with this field so they only touch the owner's partition, and
+# it doubles as the shard key prefix when the collection is sharded.
+OWNER_FIELD = "owner_id"
+SHARD_KEY = {OWNER_FIELD: ASCENDING, "UUID": ASCENDING}
+
+# Last time a candidate was created or updated, used to move stale candidates
+# from the hot collection to the archive.
+UPDATED_AT_FIELD = "updated_at"
+
+# Marks the hot candidates claimed by one run of the archiving job.
+ARCHIVE_RUN_FIELD = "archive_run"
+
+# Bookkeeping fields that are not part of the Candidate model.
+HIDDEN_FIELDS = {OWNER_FIELD: 0, UPDATED_AT_FIELD: 0, ARCHIVE_RUN_FIELD: 0}
+
+
 class CandidateRepository:
     def __init__(self, mongo_db: MongoDB):
         """Initializes the repository with a MongoDB instance."""
         self.collection = mongo_db.db["candidate"]
+        self.archive = mongo_db.db["candidate_archive"]
+        self.create_indexes()
 
-    def create_candidate(self, candidate: Candidate) -> str:
-        """Adds a new candidate to the database."""
-        return str(self.collection.insert_one(candidate.dict()).inserted_id)
+    def create_indexes(self):
+        """
+        Creates the compound indexes that lead with the owner key.
+        UUIDs are only unique among documents that have an owner, so legacy
+        candidates without one never block the build. Failures are logged
+        instead of raised so the app still starts.
+        """
+        try:
+            for collection in (self.collection, self.archive):
+                collection.create_index(
+                    list(SHARD_KEY.items()), unique=True,
+                    partialFilterExpression={OWNER_FIELD: {"$exists": True}})
+                collection.create_index([(OWNER_FIELD, ASCENDING), ("email", ASCENDING)])
+            self.collection.create_index([(UPDATED_AT_FIELD, ASCENDING)])
+        except PyMongoError:
+            logging.exception("Creating candidate indexes failed")
 
-    def get_candidate_by_uuid(self, uuid: str) -> dict:
-        """Retrieves a candidate by UUID."""
-        return self.collection.find_one({"UUID": uuid})
+    def _owner_query(self, owner_id: str, query: dict = None) -> dict:
+        """Scopes a query to the owner's partition; the owner key always wins."""
+        return {**(query or {}), OWNER_FIELD: owner_id}
 
-    def update_candidate(self, uuid: str, candidate: Candidate) -> dict:
-        """Updates a candidate's information."""
-        response = self.collection.replace_one({"UUID": uuid}, candidate.dict())
+    def _document(self, owner_id: str, candidate: dict) -> dict:
+        """Builds the stored document for a candidate, stamping its update time."""
+        return {**self._owner_query(owner_id, candidate), UPDATED_AT_FIELD: datetime.utcnow()}
+
+    def create_candidate(self, owner_id: str, candidate: Candidate) -> str:
+        """Adds a new candidate to the owner's partition."""
+        document = self._document(owner_id, candidate.dict())
+        return str(self.collection.insert_one(document).inserted_id)
+
+    def create_candidates(self, candidates: list) -> tuple:
+        """
+        Adds a batch of (owner_id, candidate document) pairs with one unordered insert.
+        Returns the inserted ids in input order (None where the insert failed) and
+        the write errors keyed by input index.
+        """
+        documents = [self._document(owner_id, document) for owner_id, document in candidates]
+        write_errors = {}
+        try:
+            self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as error:
+            write_errors = {write_error["index"]: write_error
+                            for write_error in error.details.get("writeErrors", [])}
+        # insert_many assigns each document its _id before sending it
+        inserted_ids = [None if index in write_errors else str(document["_id"])
+                        for index, document in enumerate(documents)]
+        return inserted_ids, write_errors
+
+    def get_candidate_by_uuid(self, owner_id: str, uuid: str) -> dict:
+        """Retrieves an owner's candidate by UUID, falling back to the archive."""
+        query = self._owner_query(owner_id, {"UUID": uuid})
+        return self.collection.find_one(query) or self.archive.find_one(query)
+
+    def update_candidate(self, owner_id: str, uuid: str, candidate: Candidate) -> dict:
+        """Updates a candidate's information, moving it back from the archive if needed."""
+        query = self._owner_query(owner_id, {"UUID": uuid})
+        document = self._document(owner_id, {**candidate.dict(), "UUID": uuid})
+        response = self.collection.replace_one(query, document)
+        if response.matched_count == 0:
+            archived = self.archive.find_one(query, {"_id": 1})
+            if archived:
+                # Restore under the same _id, and only drop the archive copy once it is back
+                response = self.collection.insert_one({**document, "_id": archived["_id"]})
+                self.archive.delete_one({"_id": archived["_id"]})
         return response
 
-    def delete_candidate(self, uuid: str) -> dict:
-        """Removes a candidate from the database."""
-        return self.collection.delete_one({"UUID": uuid})
+    def delete_candidate(self, owner_id: str, uuid: str) -> dict:
+        """Removes a candidate from both the database and the archive."""
+        query = self._owner_query(owner_id, {"UUID": uuid})
+        response = self.collection.delete_one(query)
+        # Always clear the archive too, in case the archiving job is copying the candidate
+        archived_response = self.archive.delete_one(query)
+        return response if response.deleted_count else archived_response
 
-    def get_all_candidates(self) -> list:
-        """Retrieves all candidates from the database."""
-        response = self.collection.find()
+    def get_all_candidates(self, owner_id: str, include_archived: bool = False) -> list:
+        """Retrieves all candidates of an owner from the database."""
+        response = list(self.collection.find(self._owner_query(owner_id), HIDDEN_FIELDS))
+        if include_archived:
+            response += self.archive.find(self._owner_query(owner_id), HIDDEN_FIELDS)
         response = json.loads(dumps(response))
         return response
 
-    def search_candidates(self, attribute: str, value: str) -> list:
-        """Searches candidates by a specific attribute."""
-        query = {attribute: {"$regex": value, "$options": "i"}}
-        candidates_data = self.collection.find(query)
-        return list(candidates_data)
+    def search_candidates(self, owner_id: str, attribute: str, value: str,
+                          include_archived: bool = False) -> list:
+        """Searches an owner's candidates by a specific attribute."""
+        query = self._owner_query(owner_id, {attribute: {"$regex": value, "$options": "i"}})
+        candidates_data = list(self.collection.find(query, HIDDEN_FIELDS))
+        if include_archived:
+            candidates_data += self.archive.find(query, HIDDEN_FIELDS)
+        return candidates_data
+
+    def get_candidate_by_email(self, owner_id: str, email: str) -> dict:
+        """Retrieves an owner's candidate by email address, falling back to the archive."""
+        query = self._owner_query(owner_id, {"email": email})
+        return self.collection.find_one(query) or self.archive.find_one(query)
+
+    def get_existing_emails(self, keys: list) -> set:
+        """Returns which of the given (owner_id, email) pairs already exist, including archived ones."""
+        emails_by_owner = {}
+        for owner_id, email in keys:
+            emails_by_owner.setdefault(owner_id, set()).add(email)
+        query = {"$or": [{OWNER_FIELD: owner_id, "email": {"$in": list(emails)}}
+                         for owner_id, emails in emails_by_owner.items()]}
+        existing = set()
+        for collection in (self.collection, self.archive):
+            for candidate in collection.find(query, {OWNER_FIELD: 1, "email": 1}):
+                existing.add((candidate[OWNER_FIELD], candidate["email"]))
+        return existing
 
-    def get_candidate_by_email(self, email: str) -> dict:
-        """Retrieves a candidate by email address."""
-        return self.collection.find_one({"email": email})
\ No newline at end of file
+    def archive_stale_candidates(self, cutoff: datetime, owner_id: str = None,
+                                 batch_size: int = 1000) -> int:
+        """
+        Moves candidates not updated since cutoff to the archive collection, for
+        every owner or only for owner_id.
+        Candidates stored before update times were recorded are aged by their ObjectId.
+        Returns the number of archived candidates.
+        """
+        query = {"$or": [
+            {UPDATED_AT_FIELD: {"$lt": cutoff}},
+            {UPDATED_AT_FIELD: {"$exists": False}, "_id": {"$lt": ObjectId.from_datetime(cutoff)}},
+        ]}
+        if owner_id is not None:
+            query = self._owner_query(owner_id, query)
+        archived = 0
+        while True:
+            documents = list(self.collection.find(query).limit(batch_size))
+            if not documents:
+                return archived
+            ids = {document["_id"] for document in documents}
+            self.archive.bulk_write(
+                [ReplaceOne({"_id": document["_id"]}, document, upsert=True) for document in documents],
+                ordered=False)
+            # Claim the candidates that are unchanged since they were read. Updates replace
+            # the whole document and deletes remove it, so either one drops the claim.
+            run_id = ObjectId()
+            self.collection.bulk_write([
+                UpdateOne({"_id": document["_id"], UPDATED_AT_FIELD: document.get(UPDATED_AT_FIELD)},
+                          {"$set": {ARCHIVE_RUN_FIELD: run_id}})
+                for document in documents], ordered=False)
+            claimed = {document["_id"] for document in
+                       self.collection.find({ARCHIVE_RUN_FIELD: run_id}, {"_id": 1})}
+            self.collection.delete_many({ARCHIVE_RUN_FIELD: run_id})
+            # Candidates that were not claimed, or were updated after being claimed, stay
+            # hot; their archive copies are dropped again.
+            still_hot = {document["_id"] for document in
+                         self.collection.find({"_id": {"$in": list(ids)}}, {"_id": 1})}
+            not_moved = (ids - claimed) | still_hot
+            if not_moved:
+                self.archive.delete_many({"_id": {"$in": list(not_moved)}})
+            archived += len(ids - not_moved)
+            if len(documents) < batch_size:
+                return archived
\ No newline at end of file
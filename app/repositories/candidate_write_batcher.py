@@ -0,0 +1,111 @@
+from app.models.candidate import Candidate
+from app.repositories.candidate_repository import CandidateRepository
+from concurrent.futures import Future
+from pymongo.errors import WriteError
+import queue
+import threading
+import time
+
+# MongoDB error code for unique index violations
+DUPLICATE_KEY_ERROR = 11000
+
+
+class CandidateWriteBatcher:
+    """
+    Coalesces concurrent candidate inserts into group commits.
+
+    Callers block on their own future while a single worker thread gathers
+    every insert submitted within a short window (or until the batch is full),
+    checks all of them for duplicates with one query and writes the new ones
+    with one insert_many.
+    """
+
+    def __init__(self, repository: CandidateRepository, max_batch_size: int = 100,
+                 max_wait_ms: float = 5):
+        """
+        Initializes the batcher.
+
+        Parameters:
+            - repository (CandidateRepository): The repository used for the group commits.
+            - max_batch_size (int): Maximum number of inserts per group commit.
+            - max_wait_ms (float): How long to wait for more inserts after the first one.
+        """
+        self.repository = repository
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.pending = queue.Queue()
+        self.worker = None
+        self.worker_lock = threading.Lock()
+
+    def submit(self, owner_id: str, candidate: Candidate) -> str:
+        """
+        Queues a candidate insert and waits for its group commit.
+
+        Parameters:
+            - owner_id (str): The UUID of the user owning the candidate.
+            - candidate (Candidate): Candidate data to be inserted.
+        Returns:
+            - str: The inserted candidate's ObjectId, or None if the owner already
+              has a candidate with the same email.
+        """
+        self._ensure_worker()
+        future = Future()
+        self.pending.put((owner_id, candidate.dict(), future))
+        return future.result()
+
+    def _ensure_worker(self):
+        """Starts the worker thread on first use."""
+        with self.worker_lock:
+            if self.worker is None:
+                self.worker = threading.Thread(
+                    target=self._run, name="candidate-write-batcher", daemon=True)
+                self.worker.start()
+
+    def _run(self):
+        """Collects and flushes batches forever."""
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch: list):
+        """
+        Runs one duplicate check and one insert for a batch and resolves each
+        future with its own inserted id, None for a conflict, or its own error.
+        """
+        try:
+            existing = self.repository.get_existing_emails(
+                [(owner_id, document["email"]) for owner_id, document, _ in batch])
+            to_insert = []
+            for owner_id, document, future in batch:
+                key = (owner_id, document["email"])
+                if key in existing:
+                    future.set_result(None)
+                else:
+                    # Later duplicates within the same batch conflict with the first one
+                    existing.add(key)
+                    to_insert.append((owner_id, document, future))
+            if to_insert:
+                inserted_ids, write_errors = self.repository.create_candidates(
+                    [(owner_id, document) for owner_id, document, _ in to_insert])
+                for index, (_, _, future) in enumerate(to_insert):
+                    write_error = write_errors.get(index)
+                    if write_error is None:
+                        future.set_result(inserted_ids[index])
+                    elif write_error.get("code") == DUPLICATE_KEY_ERROR:
+                        future.set_result(None)
+                    else:
+                        future.set_exception(WriteError(
+                            write_error.get("errmsg"), write_error.get("code"), write_error))
+        except Exception as error:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
\ No newline at end of file
@@ -1,9 +1,13 @@
 from app.models.candidate import Candidate
 from app.database import MongoDB
 from app.repositories.candidate_repository import CandidateRepository
+from app.repositories.candidate_write_batcher import CandidateWriteBatcher
+from app.utils.query_cache import QueryCache
 from fastapi import HTTPException, status
 import uuid
+import os
 import pandas as pd
+from datetime import datetime, timedelta
 
 class CandidateService:
     """
@@ -17,48 +21,87 @@ class CandidateService:
         Initializes the CandidateService instance.
         Parameters:
             - mongo_db (MongoDB): An instance of the MongoDB class for database operations.
+
+        Environment Variables:
+            CANDIDATE_WRITE_BATCHING (str): "true" to coalesce concurrent creates into group commits.
+            CANDIDATE_WRITE_BATCH_SIZE (int): Maximum number of creates per group commit.
+            CANDIDATE_WRITE_BATCH_WAIT_MS (float): How long a group commit waits for more creates.
+            SEARCH_CACHE_MAX_ENTRIES (int): Maximum number of cached search results.
+            SEARCH_CACHE_TTL_SECONDS (float): How long a cached search result is served.
         """
         self.repository = CandidateRepository(mongo_db)
+        self.write_batcher = None
+        if os.getenv("CANDIDATE_WRITE_BATCHING", "false").lower() == "true":
+            self.write_batcher = CandidateWriteBatcher(
+                self.repository,
+                max_batch_size=int(os.getenv("CANDIDATE_WRITE_BATCH_SIZE", "100")),
+                max_wait_ms=float(os.getenv("CANDIDATE_WRITE_BATCH_WAIT_MS", "5")))
+        self.search_cache = QueryCache(
+            max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024")),
+            ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "60")))
 
-    def create_candidate(self, candidate_data: Candidate):
+    def create_candidate(self, owner_id: str, candidate_data: Candidate):
         """
-        Creates a new candidate and inserts it into the database.
+        Creates a new candidate and inserts it into the owner's partition.
         Parameters:
+            - owner_id (str): The UUID of the user owning the candidate.
             - candidate_data (Candidate): Candidate data to be inserted.
 
         Returns:
             - tuple: A tuple containing the inserted candidate's MongoDB ObjectId and UUID.
+        Raises:
+            - HTTPException: If the owner already has a candidate with the same email.
         """
-        candidate = self.repository.get_candidate_by_email(candidate_data.email)
+        if self.write_batcher:
+            return self._create_candidate_batched(owner_id, candidate_data)
+
+        candidate = self.repository.get_candidate_by_email(owner_id, candidate_data.email)
         if candidate:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT, detail="Candidate Already Exists")
 
         candidate_uuid = str(uuid.uuid4())
         candidate_data.UUID = candidate_uuid
-        inserted_id = self.repository.create_candidate(candidate_data)
+        inserted_id = self.repository.create_candidate(owner_id, candidate_data)
+        self.search_cache.invalidate(owner_id)
+        return inserted_id, candidate_uuid
+
+    def _create_candidate_batched(self, owner_id: str, candidate_data: Candidate):
+        """
+        Creates a candidate through the write batcher, which checks for duplicates
+        and inserts together with other concurrent creates.
+        """
+        candidate_uuid = str(uuid.uuid4())
+        candidate_data.UUID = candidate_uuid
+        inserted_id = self.write_batcher.submit(owner_id, candidate_data)
+        if inserted_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT, detail="Candidate Already Exists")
+        self.search_cache.invalidate(owner_id)
         return inserted_id, candidate_uuid
 
-    def get_candidate_by_uuid(self, uuid: str):
+    def get_candidate_by_uuid(self, owner_id: str, uuid: str):
         """
-        Retrieves a candidate by UUID from the database.
+        Retrieves a candidate by UUID from the owner's partition.
         Parameters:
+            - owner_id (str): The UUID of the user owning the candidate.
             - uuid (str): The UUID of the candidate to retrieve.
         Returns:
             - Candidate: An instance of the Candidate model representing the retrieved candidate.
         Raises:
             - HTTPException: If the candidate with the specified UUID is not found.
         """
-        candidate_data = self.repository.get_candidate_by_uuid(uuid)
+        candidate_data = self.repository.get_candidate_by_uuid(owner_id, uuid)
         if not candidate_data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Candidate not found")
         return Candidate(**candidate_data)
 
-    def update_candidate(self, uuid: str, candidate: Candidate):
+    def update_candidate(self, owner_id: str, uuid: str, candidate: Candidate):
         """
         Updates a candidate in the database.
         Parameters:
+            - owner_id (str): The UUID of the user owning the candidate.
             - uuid (str): The UUID of the candidate to update.
             - candidate (Candidate): Candidate data for the update.
         Returns:
@@ -66,49 +109,80 @@ class CandidateService:
         Raises:
             - HTTPException: If the candidate with the specified UUID is not found.
         """
-        if not self.repository.get_candidate_by_uuid(uuid):
+        if not self.repository.get_candidate_by_uuid(owner_id, uuid):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Candidate not found")
-        return self.repository.update_candidate(uuid, candidate)
+        response = self.repository.update_candidate(owner_id, uuid, candidate)
+        self.search_cache.invalidate(owner_id)
+        return response
 
-    def delete_candidate(self, uuid: str):
+    def delete_candidate(self, owner_id: str, uuid: str):
         """
         Deletes a candidate from the database.
         Parameters:
+            - owner_id (str): The UUID of the user owning the candidate.
             - uuid (str): The UUID of the candidate to delete.
         Returns:
             - dict: A dictionary containing information about the deletion.
         Raises:
             - HTTPException: If the candidate with the specified UUID is not found.
         """
-        if not self.repository.get_candidate_by_uuid(uuid):
+        if not self.repository.get_candidate_by_uuid(owner_id, uuid):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Candidate not found")
-        return self.repository.delete_candidate(uuid)
+        response = self.repository.delete_candidate(owner_id, uuid)
+        self.search_cache.invalidate(owner_id)
+        return response
 
-    def get_all_candidates(self):
+    def get_all_candidates(self, owner_id: str, include_archived: bool = False):
         """
-        Retrieves a list of all candidates from the database.
+        Retrieves a list of all candidates owned by a user.
 
+        Parameters:
+            - owner_id (str): The UUID of the user owning the candidates.
+            - include_archived (bool): Whether to include archived candidates.
         Returns:
-            - list: A list of dictionaries representing all candidates in the database.
+            - list: A list of dictionaries representing the owner's candidates.
         """
-        return self.repository.get_all_candidates()
+        return self.repository.get_all_candidates(owner_id, include_archived)
 
-    def search_candidates(self, attribute: str, value: str):
+    def search_candidates(self, owner_id: str, attribute: str, value: str,
+                          include_archived: bool = False):
         """
-        Searches for candidates based on a specified attribute and value.
+        Searches for an owner's candidates based on a specified attribute and value.
+        Results are cached until the owner's candidates change, and identical
+        concurrent searches share one database query.
 
         Parameters:
+            - owner_id (str): The UUID of the user owning the candidates.
             - attribute (str): The attribute to search for (e.g., "first_name").
             - value (str): The value to search for within the specified attribute.
+            - include_archived (bool): Whether to include archived candidates.
         Returns:
             - list: A list of dictionaries representing candidates that match the search criteria.
         """
-        return self.repository.search_candidates(attribute, value)
+        key = (owner_id, attribute.strip(), value, include_archived)
+        return self.search_cache.get_or_compute(
+            key, lambda: self.repository.search_candidates(owner_id, *key[1:]))
     
-    def generate_csv_content(self):
-        data = self.repository.get_all_candidates()
+    def generate_csv_content(self, owner_id: str, include_archived: bool = False):
+        data = self.repository.get_all_candidates(owner_id, include_archived)
         df = pd.DataFrame(data)
         csv_content = df.to_csv(index=False).encode('utf-8')
-        return csv_content
\ No newline at end of file
+        return csv_content
+
+    def archive_stale_candidates(self, max_age_days: float, owner_id: str = None):
+        """
+        Moves candidates that have not been updated for max_age_days to the archive.
+
+        Parameters:
+            - max_age_days (float): Age in days after which a candidate is archived.
+            - owner_id (str): Only archive this user's candidates; all owners if None.
+        Returns:
+            - int: The number of archived candidates.
+        """
+        cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+        archived = self.repository.archive_stale_candidates(cutoff, owner_id)
+        if archived:
+            self.search_cache.invalidate(owner_id)
+        return archived
\ No newline at end of file
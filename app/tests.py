@@ -1,14 +1,51 @@
 # tests/test_main.py
 
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from fastapi.testclient import TestClient
 from .main import app
+from . import main
+from .services.candidate_service import CandidateService
+from .repositories.candidate_write_batcher import CandidateWriteBatcher
+from .utils import compression
+from .utils.query_cache import QueryCache
+from .utils.compression import CompressionMiddleware, PrecompressedCache, StreamCompressor, negotiate_encoding, PREFERRED_ENCODINGS
 from fastapi import status
 from datetime import timedelta
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import threading
+import time
+import uuid
+import zlib
 
 import pytest
 
 client = TestClient(app)
 access_token =None
+
+def candidate_payload(email):
+    return {
+            "first_name":"Sami",
+            "last_name":"Salhab",
+            "email":email,
+            "career_level":"Mid Level",
+            "job_major":"Computer Science",
+            "years_of_experience":2,
+            "degree_type":"Bachelor",
+            "skills":["python","fastapi","mongodb"],
+            "nationality":"Jordanian",
+            "city":"Amman",
+            "salary":"1000",
+            "gender":"Male"
+    }
+
+def create_user_token(email):
+    user_data = {"first_name": "test_first", "last_name": "last_first", "email": email, "password": "testpassword"}
+    client.post("/user", json=user_data)
+    response = client.post("/token", data={"username": email, "password": "testpassword"})
+    return response.json()["access_token"]
+
 # Test health check endpoint
 def test_health_check():
     response = client.get("/health")
@@ -126,4 +163,287 @@ def test_search_candidates():
     assert response.status_code == 200
     assert isinstance(response.json(), list)
 
+# Test a new candidate shows up in a search that was cached before it was created
+def test_search_cache_invalidated_by_create():
+    headers = {"Authorization": f"Bearer {access_token}"}
+    email = f"cached-{uuid.uuid4()}@test.com"
+    search_params = {"attribute": "email", "value": email}
+    assert client.get("/all_candidates/search", params=search_params, headers=headers).json() == []
+    candidate_uuid = client.post("/candidate", json=candidate_payload(email), headers=headers).json()["uuid"]
+    response = client.get("/all_candidates/search", params=search_params, headers=headers)
+    assert [candidate["UUID"] for candidate in response.json()] == [candidate_uuid]
+
+    response = client.get("/all_candidates/search/cache-stats", headers=headers)
+    assert response.status_code == 200
+    assert {"hits", "misses", "coalesced", "evictions", "entries", "hit_rate"} <= set(response.json())
+
+# Test identical concurrent searches share one query
+def test_query_cache_single_flight():
+    cache = QueryCache()
+    release = threading.Event()
+    calls = []
+    def search():
+        calls.append(1)
+        release.wait(5)
+        return ["result"]
+    with ThreadPoolExecutor(5) as executor:
+        futures = [executor.submit(cache.get_or_compute, ("owner", "city", "Amman"), search) for _ in range(5)]
+        while cache.stats()["misses"] + cache.stats()["coalesced"] < 5:
+            time.sleep(0.01)
+        release.set()
+        results = [future.result() for future in futures]
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert cache.stats()["coalesced"] == 4
+
+# Test writes invalidate only their owner's cached searches
+def test_query_cache_invalidation():
+    cache = QueryCache()
+    calls = []
+    def search():
+        calls.append(1)
+        return len(calls)
+    assert cache.get_or_compute(("owner", "city", "Amman"), search) == 1
+    assert cache.get_or_compute(("owner", "city", "Amman"), search) == 1
+    cache.invalidate("other")
+    assert cache.get_or_compute(("owner", "city", "Amman"), search) == 1
+    cache.invalidate("owner")
+    assert cache.get_or_compute(("owner", "city", "Amman"), search) == 2
+    cache.invalidate()
+    assert cache.get_or_compute(("owner", "city", "Amman"), search) == 3
+    assert cache.stats()["hits"] == 2
+
+# Test cached searches expire after the TTL
+def test_query_cache_ttl():
+    cache = QueryCache(ttl_seconds=0.05)
+    calls = []
+    def search():
+        calls.append(1)
+        return len(calls)
+    assert cache.get_or_compute(("owner", "city", "Amman"), search) == 1
+    assert cache.get_or_compute(("owner", "city", "Amman"), search) == 1
+    time.sleep(0.1)
+    assert cache.get_or_compute(("owner", "city", "Amman"), search) == 2
+
+# Test the least recently used search is evicted when the cache is full
+def test_query_cache_lru_eviction():
+    cache = QueryCache(max_entries=2)
+    calls = []
+    def search():
+        calls.append(1)
+        return len(calls)
+    cache.get_or_compute(("owner", "a"), search)
+    cache.get_or_compute(("owner", "b"), search)
+    cache.get_or_compute(("owner", "a"), search)
+    cache.get_or_compute(("owner", "c"), search)
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["entries"] == 2
+    assert cache.get_or_compute(("owner", "a"), search) == 1
+    assert cache.get_or_compute(("owner", "b"), search) == 4
+
+# Test a result computed while a write happened is not cached
+def test_query_cache_skips_results_racing_a_write():
+    cache = QueryCache()
+    calls = []
+    def search():
+        calls.append(1)
+        if len(calls) == 1:
+            cache.invalidate("owner")
+        return len(calls)
+    assert cache.get_or_compute(("owner", "city", "Amman"), search) == 1
+    assert cache.stats()["entries"] == 0
+    assert cache.get_or_compute(("owner", "city", "Amman"), search) == 2
+    assert cache.get_or_compute(("owner", "city", "Amman"), search) == 2
+
+# Test candidates are only visible to their owner
+def test_candidates_partitioned_per_owner():
+    other_token = create_user_token("other@example.com")
+    headers = {"Authorization": f"Bearer {access_token}"}
+    other_headers = {"Authorization": f"Bearer {other_token}"}
+    email = f"shared-{uuid.uuid4()}@test.com"
+    response = client.post("/candidate", json=candidate_payload(email), headers=headers)
+    assert response.status_code == 200
+    candidate_uuid = response.json()["uuid"]
+
+    response = client.get(f"/candidate/{candidate_uuid}", headers=other_headers)
+    assert response.status_code == 404
+    response = client.get("/all_candidates", headers=other_headers)
+    assert candidate_uuid not in [candidate["UUID"] for candidate in response.json()]
+    response = client.get("/all_candidates/search", params={"attribute": "email", "value": email}, headers=other_headers)
+    assert response.json() == []
+
+    response = client.post("/candidate", json=candidate_payload(email), headers=other_headers)
+    assert response.status_code == 200
+    assert response.json()["uuid"] != candidate_uuid
+
+# Test response compression negotiation
+def test_negotiate_encoding():
+    assert negotiate_encoding("") is None
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0") is None
+    assert negotiate_encoding("*") == PREFERRED_ENCODINGS[0]
+
+compression_app = FastAPI()
+compression_app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+@compression_app.get("/small")
+def small_response():
+    return {"message": "small"}
+
+@compression_app.get("/stream")
+def stream_response():
+    return StreamingResponse(b"chunk %d " % index * 100 for index in range(5))
+
+compression_client = TestClient(compression_app)
+
+# Test bodies below the minimum size are sent uncompressed
+def test_compression_skips_small_bodies():
+    response = compression_client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.json() == {"message": "small"}
+
+# Test streaming responses are compressed and decode correctly
+def test_compression_streaming_response():
+    response = compression_client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.content == b"".join(b"chunk %d " % index * 100 for index in range(5))
+
+# Test every supported encoding round-trips through the stream compressor
+@pytest.mark.parametrize("encoding", PREFERRED_ENCODINGS)
+def test_stream_compressor_round_trip(encoding):
+    compressor = StreamCompressor(encoding)
+    chunks = [b"candidate,report\n" * 50, b"", b"last line\n"]
+    body = b"".join(compressor.compress(chunk) for chunk in chunks) + compressor.finish()
+    if encoding == "zstd":
+        decoded = compression.zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    elif encoding == "br":
+        decoded = compression.brotli.decompress(body)
+    else:
+        decoded = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    assert decoded == b"".join(chunks)
+
+# Test concurrent downloads of one report share a single compression
+def test_precompressed_cache_single_flight(monkeypatch):
+    calls = []
+    def counting_compress(body, encoding):
+        calls.append(encoding)
+        return compression.gzip.compress(body)
+    monkeypatch.setattr(compression, "compress", counting_compress)
+    cache = PrecompressedCache()
+
+    async def download_all():
+        return await asyncio.gather(*[cache.get("owner", b"report" * 100, "gzip") for _ in range(10)])
+    results = asyncio.run(download_all())
+    assert len(calls) == 1
+    assert len(set(results)) == 1
+    asyncio.run(cache.get("owner", b"report" * 100, "gzip"))
+    assert len(calls) == 1
+    asyncio.run(cache.get("owner", b"changed report", "gzip"))
+    assert len(calls) == 2
+
+# Test compressed report download
+def test_generate_report_compressed():
+    response = client.get("/generate-report", headers={"Authorization": f"Bearer {access_token}", "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("text/csv")
+
+# Test batched candidate creates resolve duplicates per request
+def test_create_candidate_batched(monkeypatch):
+    monkeypatch.setenv("CANDIDATE_WRITE_BATCHING", "true")
+    monkeypatch.setenv("CANDIDATE_WRITE_BATCH_WAIT_MS", "50")
+    monkeypatch.setattr(main, "candidate_service", CandidateService(main.mongo_db))
+    candidate_data = {
+            "first_name":"Batch",
+            "last_name":"Salhab",
+            "email":"batch@test.com",
+            "career_level":"Mid Level",
+            "job_major":"Computer Science",
+            "years_of_experience":2,
+            "degree_type":"Bachelor",
+            "skills":["python"],
+            "nationality":"Jordanian",
+            "city":"Amman",
+            "salary":"1000",
+            "gender":"Male"
+    }
+    def create(_):
+        return client.post("/candidate", json=candidate_data, headers={"Authorization": f"Bearer {access_token}"})
+    with ThreadPoolExecutor(2) as executor:
+        responses = list(executor.map(create, range(2)))
+    assert sorted(response.status_code for response in responses) == [200, 409]
+
+class FakeCandidateRepository:
+    def __init__(self, existing, write_errors=None):
+        self.existing = existing
+        self.write_errors = write_errors or {}
+        self.inserted = []
+
+    def get_existing_emails(self, keys):
+        return {key for key in keys if key in self.existing}
+
+    def create_candidates(self, candidates):
+        self.inserted.append(candidates)
+        inserted_ids = [None if index in self.write_errors else f"id-{index}"
+                        for index in range(len(candidates))]
+        return inserted_ids, self.write_errors
+
+# Test a batch flush gives each caller its own result
+def test_write_batcher_flush():
+    repository = FakeCandidateRepository(existing={("owner", "old@test.com")})
+    batch = [(owner_id, {"email": email}, Future()) for owner_id, email in [
+        ("owner", "new@test.com"), ("owner", "old@test.com"),
+        ("owner", "new@test.com"), ("other", "new@test.com")]]
+    CandidateWriteBatcher(repository)._flush(batch)
+    assert [future.result() for _, _, future in batch] == ["id-0", None, None, "id-1"]
+    assert len(repository.inserted) == 1
+
+# Test a failed insert only fails its own caller
+def test_write_batcher_flush_write_errors():
+    repository = FakeCandidateRepository(existing=set(), write_errors={
+        0: {"index": 0, "code": 11000, "errmsg": "duplicate key"},
+        1: {"index": 1, "code": 121, "errmsg": "validation failed"}})
+    batch = [("owner", {"email": f"{index}@test.com"}, Future()) for index in range(3)]
+    CandidateWriteBatcher(repository)._flush(batch)
+    assert batch[0][2].result() is None
+    assert batch[1][2].exception() is not None
+    assert batch[2][2].result() == "id-2"
+
+# Test archived candidates are still readable and restored on update
+def test_archive_stale_candidates():
+    owner_email = "archive@example.com"
+    headers = {"Authorization": f"Bearer {create_user_token(owner_email)}"}
+    owner_id = main.user_service.get_user(owner_email)["uuid"]
+    email = f"archived-{uuid.uuid4()}@test.com"
+    candidate_uuid = client.post("/candidate", json=candidate_payload(email), headers=headers).json()["uuid"]
+    # Only archive this test's own owner
+    assert main.candidate_service.archive_stale_candidates(0, owner_id) >= 1
+
+    response = client.get(f"/candidate/{candidate_uuid}", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["email"] == email
+
+    response = client.get("/all_candidates", headers=headers)
+    assert candidate_uuid not in [candidate["UUID"] for candidate in response.json()]
+    response = client.get("/all_candidates", params={"include_archived": "true"}, headers=headers)
+    assert candidate_uuid in [candidate["UUID"] for candidate in response.json()]
+
+    search_params = {"attribute": "email", "value": email}
+    response = client.get("/all_candidates/search", params=search_params, headers=headers)
+    assert response.json() == []
+    response = client.get("/all_candidates/search", params={**search_params, "include_archived": "true"}, headers=headers)
+    assert [candidate["UUID"] for candidate in response.json()] == [candidate_uuid]
+
+    response = client.get("/generate-report", headers=headers)
+    assert candidate_uuid not in response.text
+    response = client.get("/generate-report", params={"include_archived": "true"}, headers=headers)
+    assert candidate_uuid in response.text
+
+    response = client.put(f"/candidate/{candidate_uuid}", json=candidate_payload(email), headers=headers)
+    assert response.status_code == 200
+    response = client.get("/all_candidates", headers=headers)
+    assert candidate_uuid in [candidate["UUID"] for candidate in response.json()]
+
 # Add more tests for other endpoints as needed
@@ -0,0 +1,274 @@
+import asyncio
+import gzip
+import hashlib
+import zlib
+from collections import OrderedDict
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, gzip is always available
+    zstandard = None
+
+# Server side preference when the client weighs several encodings equally.
+PREFERRED_ENCODINGS = [
+    encoding for encoding, available in (
+        ("zstd", zstandard is not None),
+        ("br", brotli is not None),
+        ("gzip", True),
+    ) if available
+]
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    """
+    Picks the best supported content encoding for an Accept-Encoding header.
+
+    Args:
+        accept_encoding (str): The raw Accept-Encoding header value.
+
+    Returns:
+        str: The chosen encoding, or None if the body should be sent as is.
+    """
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in PREFERRED_ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """
+    Compresses a complete body with the given content encoding.
+
+    Args:
+        body (bytes): The uncompressed body.
+        encoding (str): One of "gzip", "br" or "zstd".
+
+    Returns:
+        bytes: The compressed body.
+    """
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+class StreamCompressor:
+    """Incremental compressor that flushes a decodable block per chunk."""
+
+    def __init__(self, encoding: str):
+        """
+        Initializes the compressor.
+
+        Args:
+            encoding (str): One of "gzip", "br" or "zstd".
+        """
+        self.encoding = encoding
+        if encoding == "zstd":
+            self.compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        elif encoding == "br":
+            self.compressor = brotli.Compressor(quality=5)
+        else:
+            self.compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk: bytes) -> bytes:
+        """Compresses a chunk and flushes it so the client can decode it right away."""
+        if self.encoding == "zstd":
+            return (self.compressor.compress(chunk)
+                    + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK))
+        if self.encoding == "br":
+            return self.compressor.process(chunk) + self.compressor.flush()
+        return self.compressor.compress(chunk) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        """Ends the compressed stream."""
+        if self.encoding == "br":
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with gzip, brotli or zstd based on
+    the request's Accept-Encoding header.
+
+    Responses that already carry a Content-Encoding (for example pre-compressed
+    report snapshots) are passed through untouched.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500, offload_min_size: int = 64 * 1024):
+        """
+        Initializes the middleware.
+
+        Args:
+            app (ASGIApp): The wrapped application.
+            minimum_size (int): Bodies smaller than this are sent uncompressed.
+            offload_min_size (int): Bodies or chunks of at least this size are
+                compressed in a worker thread instead of on the event loop.
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_min_size = offload_min_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            headers = Headers(scope=scope)
+            encoding = negotiate_encoding(headers.get("Accept-Encoding", ""))
+            if encoding:
+                responder = CompressionResponder(
+                    self.app, encoding, self.minimum_size, self.offload_min_size)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class CompressionResponder:
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int, offload_min_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.offload_min_size = offload_min_size
+        self.send = None
+        self.initial_message = {}
+        self.started = False
+        self.content_encoding_set = False
+        self.compressor = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def run(self, func, *args) -> bytes:
+        """Runs a compression step, off the event loop when the input is large."""
+        if len(args[0]) >= self.offload_min_size:
+            return await anyio.to_thread.run_sync(func, *args)
+        return func(*args)
+
+    async def send_compressed(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Hold the initial message until we know how to rewrite its headers.
+            self.initial_message = message
+            headers = Headers(raw=self.initial_message["headers"])
+            self.content_encoding_set = "content-encoding" in headers
+        elif message_type == "http.response.body" and self.content_encoding_set:
+            if not self.started:
+                self.started = True
+                await self.send(self.initial_message)
+            await self.send(message)
+        elif message_type == "http.response.body" and not self.started:
+            self.started = True
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if len(body) < self.minimum_size and not more_body:
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                # First chunk of a streaming response.
+                del headers["Content-Length"]
+                self.compressor = StreamCompressor(self.encoding)
+                message["body"] = await self.run(self.compressor.compress, body)
+            else:
+                message["body"] = await self.run(compress, body, self.encoding)
+                headers["Content-Length"] = str(len(message["body"]))
+
+            await self.send(self.initial_message)
+            await self.send(message)
+        elif message_type == "http.response.body":
+            # Remaining chunks of a streaming response.
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            compressed = await self.run(self.compressor.compress, body)
+            if not more_body:
+                compressed += self.compressor.finish()
+            message["body"] = compressed
+            await self.send(message)
+
+
+class PrecompressedCache:
+    """
+    Bounded LRU cache of compressed variants of generated payloads.
+
+    Entries are keyed by a caller supplied key and invalidated as soon as the
+    digest of the uncompressed content changes. Concurrent requests for the
+    same variant share one compression.
+    """
+
+    def __init__(self, max_entries: int = 128):
+        """
+        Initializes the cache.
+
+        Args:
+            max_entries (int): Maximum number of keys kept before evicting the
+                least recently used one.
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.in_flight = {}
+
+    async def get(self, key: str, content: bytes, encoding: str) -> bytes:
+        """
+        Returns the compressed variant of content, compressing it only if the
+        cached variant is missing or stale.
+
+        Args:
+            key (str): The cache key (e.g. the report owner).
+            content (bytes): The current uncompressed content.
+            encoding (str): One of "gzip", "br" or "zstd".
+
+        Returns:
+            bytes: The compressed content.
+        """
+        digest = await anyio.to_thread.run_sync(lambda: hashlib.sha256(content).hexdigest())
+        entry = self.entries.get(key)
+        if entry is None or entry["digest"] != digest:
+            entry = {"digest": digest, "variants": {}}
+            self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+        variants = entry["variants"]
+        if encoding in variants:
+            return variants[encoding]
+
+        flight_key = (key, digest, encoding)
+        task = self.in_flight.get(flight_key)
+        if task is None:
+            task = asyncio.ensure_future(anyio.to_thread.run_sync(compress, content, encoding))
+            self.in_flight[flight_key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(flight_key, None))
+        # A cancelled download must not cancel the compression other requests wait for
+        variants[encoding] = await asyncio.shield(task)
+        return variants[encoding]
@@ -0,0 +1,122 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+import threading
+import time
+
+
+class QueryCache:
+    """
+    Thread safe LRU cache of query results with TTL and single-flight loading.
+
+    Keys are tuples whose first element is the partition (e.g. the owner) the
+    query reads from. Writes call invalidate() to bump a generation counter;
+    entries computed under an older generation are never served again.
+    Concurrent misses for the same key run the query once and share its result.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 60):
+        """
+        Initializes the cache.
+
+        Args:
+            max_entries (int): Maximum number of cached results before evicting
+                the least recently used one.
+            ttl_seconds (float): How long a cached result may be served.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.global_generation = 0
+        self.generations = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def invalidate(self, partition=None):
+        """
+        Bumps the generation of a partition, or of the whole cache if partition is None.
+
+        Args:
+            partition: The partition whose data changed.
+        """
+        with self.lock:
+            if partition is None:
+                self.global_generation += 1
+            else:
+                self.generations[partition] = self.generations.get(partition, 0) + 1
+
+    def get_or_compute(self, key: tuple, compute):
+        """
+        Returns the cached result for key, computing it at most once at a time.
+
+        Args:
+            key (tuple): The normalized query; key[0] is its partition.
+            compute (callable): Runs the query when the result is not cached.
+
+        Returns:
+            The query result, shared between callers; it must not be mutated.
+        """
+        with self.lock:
+            generation = (self.global_generation, self.generations.get(key[0], 0))
+            entry = self.entries.get(key)
+            if entry and entry["generation"] == generation and entry["expires_at"] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry["value"]
+            flight_key = (key, generation)
+            future = self.in_flight.get(flight_key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.in_flight[flight_key] = future
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as error:
+            with self.lock:
+                del self.in_flight[flight_key]
+            future.set_exception(error)
+            raise
+
+        with self.lock:
+            del self.in_flight[flight_key]
+            # Results of queries that raced with a write are not cached
+            if generation == (self.global_generation, self.generations.get(key[0], 0)):
+                self.entries[key] = {
+                    "generation": generation,
+                    "expires_at": time.monotonic() + self.ttl_seconds,
+                    "value": value,
+                }
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        future.set_result(value)
+        return value
+
+    def stats(self) -> dict:
+        """
+        Returns the cache metrics.
+
+        Returns:
+            dict: Hits, misses, coalesced requests, evictions, entries and hit rate,
+                where coalesced requests count as hits since they ran no query.
+        """
+        with self.lock:
+            requests = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "hit_rate": (self.hits + self.coalesced) / requests if requests else 0.0,
+            }
\ No newline at end of file